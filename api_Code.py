@@ -1,7 +1,659 @@
 import os
+import glob
+import json
+import asyncio
+import logging
+import atexit
 import shutil
+import random
+import hashlib
+import uuid
 import argparse
+import threading
+from collections.abc import AsyncIterator, Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import httpx
+from PIL import Image, ImageOps, UnidentifiedImageError
 from gradio_client import Client, file
+from gradio_client.client import Job
+from gradio_client.utils import QueueError, TooManyRequestsError
+
+try:
+    # blake3 is SIMD-accelerated and much faster than SHA-256 on large images
+    import blake3
+
+    def _file_digest(path: str) -> str:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO).update_mmap(path).hexdigest()
+except ImportError:
+    def _file_digest(path: str) -> str:
+        with open(path, "rb") as f:
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            # hashlib.file_digest is only available on Python 3.11+
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+
+log = logging.getLogger("instantmesh")
+
+INSTANTMESH_SPACE = "TencentARC/InstantMesh"
+
+# Gradio clients are expensive to create (handshake + API schema discovery),
+# so clients are created lazily and kept in a per-Space pool of idle clients.
+# A client is checked out exclusively for one image at a time because
+# '/make3d' relies on session state left behind by '/generate_mvs'.
+_CLIENT_CACHE: dict[str, list[Client]] = {}
+_ALL_CLIENTS: list[Client] = []
+_CLIENT_LOCK = threading.Lock()
+
+# Output directories already created by this process
+_ENSURED_DIRS: set[str] = set()
+
+# Generated models are cached under `<output_dir>/.cache/<key>/`, keyed by a
+# streamed hash of the input image and the generation parameters. `index.json`
+# in the cache directory maps each key to the OBJ and GLB filenames returned by the Space.
+# Intermediate images are cached next to the models when they are saved; a cached
+# entry without them is treated as a miss when intermediates are requested.
+CACHE_DIRNAME = ".cache"
+PREPROCESSED_FILENAME = "preprocessed_image.png"
+MULTIVIEW_FILENAME = "multiview_generation.png"
+_UPLOADS_DIRNAME = "uploads"
+_CACHE_INDEX = "index.json"
+_CACHE_LOCK = threading.Lock()
+
+# The Space resizes inputs to 320x320, so larger images are downscaled before upload
+MAX_UPLOAD_SIZE = 1024
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024
+
+# Failed API steps are retried with exponential backoff and jitter when the shared
+# Space is busy (queue full, rate limited) or the connection drops. Errors raised
+# by the app itself (AppError) are deterministic for a given input and not retried.
+RETRY_ATTEMPTS = 3
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+_RETRIABLE_ERRORS = (
+    httpx.HTTPError, QueueError, TooManyRequestsError, ConnectionError, TimeoutError
+)
+
+# Endpoint fn_index by (Space URL, api_name), resolved once from the API schema
+_FN_INDEXES: dict[tuple[str, str], int] = {}
+
+# Image hashes by (path, size, mtime), so unchanged files are only hashed once
+_HASH_CACHE: dict[tuple[str, int, int], str] = {}
+
+# Guards the temporary lifting of Pillow's decompression-bomb limit in _open_image
+_PIL_LIMIT_LOCK = threading.Lock()
+
+
+@asynccontextmanager
+async def _get_client(space: str = INSTANTMESH_SPACE) -> AsyncIterator[Client]:
+    """
+    Checks out a Gradio client for the given Space, creating one if none is idle.
+
+    The client is returned to the pool when the context exits, so sequential
+    calls reuse the same connection and session while concurrent calls each get
+    their own. The most recently returned client is handed out first. Each
+    client keeps the random session hash it was created with for the lifetime
+    of the process.
+
+    Args:
+        space (str): Hugging Face Space identifier. Defaults to "TencentARC/InstantMesh".
+
+    Yields:
+        Client: A Gradio client used exclusively by the caller.
+    """
+    with _CLIENT_LOCK:
+        idle = _CLIENT_CACHE.setdefault(space, [])
+        client = idle.pop() if idle else None
+
+    if client is None:
+        log.debug("Connecting to InstantMesh Gradio API at '%s'...", space)
+        # Files are only downloaded when they are actually saved locally
+        client = await asyncio.to_thread(Client, space, download_files=False)
+        with _CLIENT_LOCK:
+            _ALL_CLIENTS.append(client)
+        log.debug("Connection successful (session %s).", client.session_hash)
+
+    try:
+        yield client
+    finally:
+        with _CLIENT_LOCK:
+            _CLIENT_CACHE[space].append(client)
+
+
+def _close_clients() -> None:
+    """Closes every Gradio client created by this module. Registered to run at exit."""
+    with _CLIENT_LOCK:
+        for client in _ALL_CLIENTS:
+            client.close()
+        _ALL_CLIENTS.clear()
+        _CLIENT_CACHE.clear()
+
+
+atexit.register(_close_clients)
+
+
+def _server_file(file_ref: dict) -> dict:
+    """
+    Wraps a file returned by the Space so it can be passed to another endpoint.
+
+    The file is referenced by its URL on the Space, so it is not downloaded and
+    re-uploaded between steps.
+
+    Args:
+        file_ref (dict): File data returned by `client.predict` with `download_files=False`.
+
+    Returns:
+        dict: A file reference accepted as an endpoint input.
+    """
+    return file(file_ref["url"])
+
+
+def _temp_path(path: str) -> str:
+    """
+    Returns a temporary path next to `path`, unique to this writer.
+
+    Files are written there and moved into place with `os.replace`, so readers
+    never see a partially written file, even across processes.
+    """
+    return f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+
+
+def _write_atomically(destination: str, write: Callable[[str], None]) -> None:
+    """Calls `write` with a temporary path, then moves the result to `destination`."""
+    tmp_path = _temp_path(destination)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _open_image(input_image_path: str) -> Image.Image:
+    """
+    Opens a local image without Pillow's decompression-bomb pixel limit.
+
+    The inputs are the caller's own files, and large phone photos (e.g. 200 MP)
+    exceed the limit while being exactly the images that are downscaled before
+    upload. Opening only reads the header; the limit is restored right after.
+    """
+    with _PIL_LIMIT_LOCK:
+        max_image_pixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(input_image_path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_image_pixels
+
+
+def _save_as_png(input_image_path: str, destination: str) -> None:
+    """Saves a local image in PNG format, as the Space does for processed images."""
+    with _open_image(input_image_path) as img:
+        _write_atomically(destination, lambda tmp_path: img.save(tmp_path, "PNG"))
+
+
+def _remote_filename(file_ref: dict) -> str:
+    """
+    Returns the filename of a file returned by the Space.
+
+    The path is a POSIX path on the Space, so it is split on "/" directly rather
+    than normalised with `os.path`, which would also be wrong on Windows clients.
+    """
+    return file_ref["path"].rsplit("/", 1)[-1]
+
+
+async def _download_file(
+    http: httpx.AsyncClient,
+    client: Client,
+    file_ref: dict,
+    destination: str
+) -> None:
+    """
+    Streams a file returned by the Space to a local destination.
+
+    The file only appears at `destination` once it has been fully downloaded.
+
+    Args:
+        http (httpx.AsyncClient): HTTP client shared by the downloads of one run.
+        client (Client): Gradio client whose headers authorise the download.
+        file_ref (dict): File data returned by `client.predict` with `download_files=False`.
+        destination (str): Local path to write the file to.
+    """
+    tmp_path = _temp_path(destination)
+    try:
+        async with http.stream("GET", file_ref["url"], headers=client.headers) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    f.write(chunk)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """
+    Hardlinks a file so both paths share the same data, falling back to a copy.
+
+    Args:
+        src (str): Path of the file to link.
+        dst (str): Destination path. Overwritten if it already exists.
+    """
+    try:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _hash_image(input_image_path: str, input_image_stat: os.stat_result) -> str:
+    """Returns the hex digest of an image, reusing it while the file is unchanged."""
+    memo_key = (input_image_path, input_image_stat.st_size, input_image_stat.st_mtime_ns)
+    digest = _HASH_CACHE.get(memo_key)
+    if digest is None:
+        digest = _file_digest(input_image_path)
+        _HASH_CACHE[memo_key] = digest
+    return digest
+
+
+def _cache_key(
+    input_image_path: str,
+    input_image_stat: os.stat_result,
+    do_remove_background: bool,
+    sample_steps: float,
+    sample_seed: float
+) -> str:
+    """Builds the cache key for an image and a set of generation parameters."""
+    image_hash = _hash_image(input_image_path, input_image_stat)
+    return f"{image_hash}-{int(sample_steps)}-{int(sample_seed)}-{int(do_remove_background)}"
+
+
+def _read_cache_index(output_dir: str) -> dict[str, list[str]]:
+    """Loads the cache index of an output directory, or an empty one if there is none."""
+    try:
+        with open(os.path.join(output_dir, CACHE_DIRNAME, _CACHE_INDEX)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _cached_models(
+    output_dir: str,
+    cache_key: str,
+    save_intermediates: bool
+) -> tuple[str, str] | None:
+    """
+    Looks up previously generated models in an output directory's cache.
+
+    Args:
+        output_dir (str): Output directory whose cache is searched.
+        cache_key (str): Key returned by `_cache_key`.
+        save_intermediates (bool): Whether the intermediate images must be cached too.
+
+    Returns:
+        tuple[str, str] | None: Paths to the cached OBJ and GLB files, or None on a miss.
+    """
+    filenames = _read_cache_index(output_dir).get(cache_key)
+    if not filenames:
+        return None
+    cache_dir = os.path.join(output_dir, CACHE_DIRNAME, cache_key)
+    cached = tuple(os.path.join(cache_dir, name) for name in filenames)
+    required = list(cached)
+    if save_intermediates:
+        required += [os.path.join(cache_dir, PREPROCESSED_FILENAME),
+                     os.path.join(cache_dir, MULTIVIEW_FILENAME)]
+    if not all(os.path.exists(path) for path in required):
+        return None
+    return cached
+
+
+def _add_to_cache(output_dir: str, cache_key: str, obj_filename: str, glb_filename: str) -> None:
+    """Records the filenames of newly cached models in the cache index."""
+    index_path = os.path.join(output_dir, CACHE_DIRNAME, _CACHE_INDEX)
+    with _CACHE_LOCK:
+        index = _read_cache_index(output_dir)
+        index[cache_key] = [obj_filename, glb_filename]
+        def write(tmp_path: str) -> None:
+            with open(tmp_path, "w") as f:
+                json.dump(index, f, indent=2)
+
+        _write_atomically(index_path, write)
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    """Returns whether an image has an alpha channel or a transparent colour."""
+    return img.mode in ("RGBA", "LA") or "transparency" in img.info
+
+
+def _skips_preprocess(input_image_path: str, do_remove_background: bool) -> bool:
+    """
+    Returns whether '/preprocess' can be skipped for an image.
+
+    Without background removal '/preprocess' returns the image unchanged, so an
+    image that already has transparency is sent straight to '/generate_mvs'.
+    """
+    if do_remove_background:
+        return False
+    with _open_image(input_image_path) as img:
+        return _has_alpha(img)
+
+
+def _upload_path(input_image_path: str, output_dir: str) -> str:
+    """
+    Returns the path of the image to upload, downscaling oversized images first.
+
+    Images larger than `MAX_UPLOAD_SIZE` pixels or `MAX_UPLOAD_BYTES` bytes are
+    re-encoded to at most `MAX_UPLOAD_SIZE` pixels on their longest side. The
+    downscaled copy is kept in `<output_dir>/.cache/uploads/` under the image's
+    hash, so it is only encoded once.
+
+    Args:
+        input_image_path (str): Path to the local input image file.
+        output_dir (str): Output directory whose cache holds the downscaled copy.
+
+    Returns:
+        str: Path to the original image, or to its downscaled copy.
+    """
+    input_image_stat = os.stat(input_image_path)
+    with _open_image(input_image_path) as img:
+        if max(img.size) <= MAX_UPLOAD_SIZE and input_image_stat.st_size <= MAX_UPLOAD_BYTES:
+            return input_image_path
+
+        # Keep transparency, which JPEG cannot store
+        has_alpha = _has_alpha(img)
+        extension = "png" if has_alpha else "jpg"
+        image_hash = _hash_image(input_image_path, input_image_stat)
+        upload_dir = os.path.join(output_dir, CACHE_DIRNAME, _UPLOADS_DIRNAME)
+        downscaled_path = os.path.join(upload_dir, f"{image_hash}.{extension}")
+        if os.path.exists(downscaled_path):
+            return downscaled_path
+        os.makedirs(upload_dir, exist_ok=True)
+
+        # Shrinking first lets Pillow decode JPEGs at a reduced scale instead of
+        # holding the full-resolution image in memory; the bound is square, so
+        # applying the EXIF orientation afterwards gives the same result.
+        img.thumbnail((MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE), Image.LANCZOS)
+        img = ImageOps.exif_transpose(img)
+        if has_alpha:
+            _write_atomically(
+                downscaled_path, lambda tmp_path: img.convert("RGBA").save(tmp_path, "PNG"))
+        else:
+            _write_atomically(
+                downscaled_path,
+                lambda tmp_path: img.convert("RGB").save(tmp_path, "JPEG", quality=92))
+
+    log.debug("Downscaled '%s' for upload: %s", input_image_path, downscaled_path)
+    return downscaled_path
+
+
+def _fn_index(client: Client, api_name: str) -> int:
+    """
+    Returns the fn_index of a named endpoint, resolving it only once per Space.
+
+    Submitting by fn_index skips the lookup through the Space's dependencies that
+    `client.submit` otherwise does for every call made with `api_name`.
+    """
+    key = (client.src, api_name)
+    fn_index = _FN_INDEXES.get(key)
+    if fn_index is None:
+        fn_index = _FN_INDEXES[key] = client._infer_fn_index(api_name, None)
+    return fn_index
+
+
+def _preprocess(
+    client: Client,
+    input_image_path: str,
+    output_dir: str,
+    do_remove_background: bool
+) -> Job:
+    """Submits the '/preprocess' step for a local image whose outputs go to `output_dir`."""
+    return client.submit(
+        input_image=file(_upload_path(input_image_path, output_dir)),
+        do_remove_background=do_remove_background,
+        fn_index=_fn_index(client, "/preprocess")
+    )
+
+
+def _mvs(client: Client, input_image: dict, sample_steps: float, sample_seed: float) -> Job:
+    """Submits the '/generate_mvs' step for a file reference from `file` or `_server_file`."""
+    return client.submit(
+        input_image=input_image,
+        sample_steps=sample_steps,
+        sample_seed=sample_seed,
+        fn_index=_fn_index(client, "/generate_mvs")
+    )
+
+
+def _make3d(client: Client) -> Job:
+    """
+    Submits the '/make3d' step.
+
+    This step reads the session state left by '/generate_mvs', so it must be
+    submitted on the same client, after that job has finished.
+    """
+    return client.submit(fn_index=_fn_index(client, "/make3d"))
+
+
+async def _result(job: Job):
+    """Waits for a submitted job without blocking the event loop and returns its result."""
+    return await asyncio.wrap_future(job)
+
+
+async def _run_step(step: str, submit: Callable[[], Job], job: Job | None = None):
+    """
+    Waits for one API step, resubmitting only that step if it fails transiently.
+
+    Args:
+        step (str): Endpoint name, used in log messages.
+        submit (Callable[[], Job]): Submits the step and returns its job.
+        job (Job | None): An already submitted job for the first attempt. Defaults to None.
+
+    Returns:
+        The result of the step.
+    """
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            if job is None:
+                job = await asyncio.to_thread(submit)
+            return await _result(job)
+        except _RETRIABLE_ERRORS as e:
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            delay = min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** (attempt - 1))
+            delay += random.uniform(0, RETRY_INITIAL_DELAY)
+            log.warning("'%s' failed (attempt %d/%d): %s. Retrying in %.1fs...",
+                        step, attempt, RETRY_ATTEMPTS, e, delay)
+            await asyncio.sleep(delay)
+            job = None
+
+
+async def _generate_3d_mesh(
+    http: httpx.AsyncClient,
+    input_image_path: str,
+    output_dir: str,
+    do_remove_background: bool,
+    sample_steps: float,
+    sample_seed: float,
+    save_intermediates: bool,
+    preprocess_job: Job | None = None
+) -> tuple[str, str] | None:
+    """
+    Runs the InstantMesh pipeline for one image. See `generate_3d_mesh_from_image`.
+
+    Args:
+        http (httpx.AsyncClient): HTTP client used to download the generated files.
+        preprocess_job (Job | None): An already submitted '/preprocess' job for this
+                                     image, whose result is used instead of preprocessing
+                                     it again. Defaults to None.
+    """
+    # 1. Validate input image path, and check locally that it is a readable
+    # image so bad inputs fail before anything is uploaded
+    try:
+        input_image_stat = os.stat(input_image_path)
+        with _open_image(input_image_path) as img:
+            img.verify()
+    except FileNotFoundError:
+        log.error("Input image file not found at '%s'.", input_image_path)
+        return None
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        log.error("Input file '%s' is not a valid image: %s", input_image_path, e)
+        return None
+
+    # 2. Create output directory if it doesn't exist (once per process)
+    if output_dir not in _ENSURED_DIRS:
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+        except OSError as e:
+            log.error("Could not create output directory '%s': %s", output_dir, e)
+            return None
+        _ENSURED_DIRS.add(output_dir)
+
+    try:
+        # Reuse models already generated for this image and parameters
+        cache_key = await asyncio.to_thread(
+            _cache_key, input_image_path, input_image_stat,
+            do_remove_background, sample_steps, sample_seed)
+        cache_dir = os.path.join(output_dir, CACHE_DIRNAME, cache_key)
+        cached = _cached_models(output_dir, cache_key, save_intermediates)
+        if cached:
+            obj_filename, glb_filename = (
+                os.path.join(output_dir, os.path.basename(path)) for path in cached)
+            _link_or_copy(cached[0], obj_filename)
+            _link_or_copy(cached[1], glb_filename)
+            if save_intermediates:
+                for name in (PREPROCESSED_FILENAME, MULTIVIEW_FILENAME):
+                    _link_or_copy(os.path.join(cache_dir, name), os.path.join(output_dir, name))
+            log.info("Reusing cached 3D models for '%s': OBJ: %s, GLB: %s",
+                     input_image_path, obj_filename, glb_filename)
+            return obj_filename, glb_filename
+
+        # Check out a pooled Gradio client (connected on first use)
+        async with _get_client() as client:
+            # 3. Step 1: Preprocess the input image, unless it would be returned unchanged
+            if preprocess_job is None and await asyncio.to_thread(
+                    _skips_preprocess, input_image_path, do_remove_background):
+                log.debug("Skipping '/preprocess': '%s' already has transparency.",
+                          input_image_path)
+                processed_image_ref = None
+            else:
+                log.debug("Calling '/preprocess' with input image '%s' (remove_background: %s)...",
+                          input_image_path, do_remove_background)
+                processed_image_ref = await _run_step(
+                    "/preprocess",
+                    lambda: _preprocess(
+                        client, input_image_path, output_dir, do_remove_background),
+                    preprocess_job)
+                log.debug("'/preprocess' completed. Result: %s", processed_image_ref["path"])
+
+            # 4. Step 2: Generate multi-views from the processed image
+            def mvs_input() -> dict:
+                if processed_image_ref is None:
+                    return file(_upload_path(input_image_path, output_dir))
+                # The processed image stays on the server; only its reference is passed on.
+                return _server_file(processed_image_ref)
+
+            log.debug("Calling '/generate_mvs' with processed image (sample_steps: %s, sample_seed: %s)...",
+                      sample_steps, sample_seed)
+            generated_mvs_ref = await _run_step(
+                "/generate_mvs",
+                lambda: _mvs(client, mvs_input(), sample_steps, sample_seed))
+            log.debug("'/generate_mvs' completed. Result: %s", generated_mvs_ref["path"])
+
+            # 5. Step 3: Generate 3D model (OBJ and GLB)
+            # This step operates on the internal state after multi-view generation,
+            # so on failure only this step is retried, on the same client.
+            log.debug("Calling '/make3d' to generate OBJ and GLB models...")
+            obj_model_ref, glb_model_ref = await _run_step("/make3d", lambda: _make3d(client))
+            log.debug("'/make3d' completed. Remote OBJ: %s, Remote GLB: %s",
+                      obj_model_ref["path"], glb_model_ref["path"])
+
+            # 6. Download the generated files to the specified output directory
+            # The files are downloaded into the cache and linked into the output directory
+            os.makedirs(cache_dir, exist_ok=True)
+            obj_name = _remote_filename(obj_model_ref)
+            glb_name = _remote_filename(glb_model_ref)
+            obj_filename = os.path.join(output_dir, obj_name)
+            glb_filename = os.path.join(output_dir, glb_name)
+            downloads = [
+                _download_file(http, client, obj_model_ref, os.path.join(cache_dir, obj_name)),
+                _download_file(http, client, glb_model_ref, os.path.join(cache_dir, glb_name)),
+            ]
+            if save_intermediates:
+                preprocessed_filename = os.path.join(output_dir, PREPROCESSED_FILENAME)
+                multiview_filename = os.path.join(output_dir, MULTIVIEW_FILENAME)
+                cached_preprocessed = os.path.join(cache_dir, PREPROCESSED_FILENAME)
+                cached_multiview = os.path.join(cache_dir, MULTIVIEW_FILENAME)
+                downloads.append(
+                    _download_file(http, client, generated_mvs_ref, cached_multiview))
+                if processed_image_ref is None:
+                    downloads.append(asyncio.to_thread(
+                        _save_as_png, input_image_path, cached_preprocessed))
+                else:
+                    downloads.append(_download_file(
+                        http, client, processed_image_ref, cached_preprocessed))
+            await asyncio.gather(*downloads)
+
+            if save_intermediates:
+                _link_or_copy(cached_preprocessed, preprocessed_filename)
+                _link_or_copy(cached_multiview, multiview_filename)
+
+            log.debug("Saving generated OBJ to: %s", obj_filename)
+            _link_or_copy(os.path.join(cache_dir, obj_name), obj_filename)
+            log.debug("Saving generated GLB to: %s", glb_filename)
+            _link_or_copy(os.path.join(cache_dir, glb_name), glb_filename)
+            _add_to_cache(output_dir, cache_key, obj_name, glb_name)
+
+            if save_intermediates:
+                log.debug("Saved preprocessed image: %s, multi-view generation: %s",
+                          preprocessed_filename, multiview_filename)
+            log.info("Successfully generated 3D models for '%s': OBJ: %s, GLB: %s",
+                     input_image_path, obj_filename, glb_filename)
+
+            return obj_filename, glb_filename
+
+    except Exception as e:
+        log.error("An error occurred during API interaction or file operations: %s", e)
+        # For more granular error handling, you could catch specific exceptions like
+        # gradio_client.exceptions.AppError for API-specific errors,
+        # requests.exceptions.ConnectionError for network issues, etc.
+        return None
+
+
+def _run_sync(coro: Coroutine):
+    """
+    Runs a coroutine to completion from synchronous code and returns its result.
+
+    `asyncio.run` cannot be called while an event loop is running in the current
+    thread (e.g. in Jupyter or an async web handler), so in that case the
+    coroutine gets its own event loop on a worker thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def agenerate_3d_mesh_from_image(
+    input_image_path: str,
+    output_dir: str = "instantmesh_output",
+    do_remove_background: bool = True,
+    sample_steps: float = 75,
+    sample_seed: float = 42,
+    save_intermediates: bool = True
+) -> tuple[str, str] | None:
+    """Asynchronous version of `generate_3d_mesh_from_image`."""
+    async with httpx.AsyncClient(follow_redirects=True) as http:
+        return await _generate_3d_mesh(
+            http, input_image_path, output_dir, do_remove_background,
+            sample_steps, sample_seed, save_intermediates)
 
 
 def generate_3d_mesh_from_image(
@@ -9,12 +661,22 @@ def generate_3d_mesh_from_image(
     output_dir: str = "instantmesh_output",
     do_remove_background: bool = True,
     sample_steps: float = 75,
-    sample_seed: float = 42
+    sample_seed: float = 42,
+    save_intermediates: bool = True
 ) -> tuple[str, str] | None:
     """
     Generates a 3D mesh (OBJ and GLB formats) from an input image using the
     TencentARC/InstantMesh Gradio API.
 
+    Models previously generated from the same image contents and parameters are
+    reused from the cache in `output_dir` instead of calling the API again. When
+    `save_intermediates` is set, the intermediate images are restored from the
+    cache as well, and the API is called again if they were not cached.
+
+    Can be called from inside a running event loop (e.g. in Jupyter), in which
+    case the work runs on a worker thread; async code should prefer awaiting
+    `agenerate_3d_mesh_from_image` instead.
+
     Args:
         input_image_path (str): Path to the local input image file.
         output_dir (str): Directory to save the generated 3D models.
@@ -24,123 +686,177 @@ def generate_3d_mesh_from_image(
         sample_steps (float): Number of sample steps for multi-view generation.
                               Defaults to 75.
         sample_seed (float): Seed value for multi-view generation. Defaults to 42.
+        save_intermediates (bool): Whether to download the preprocessed and multi-view
+                                   images alongside the models. Defaults to True.
 
     Returns:
         tuple[str, str] | None: A tuple containing the paths to the saved OBJ and GLB
                                 files, or None if an error occurred.
     """
-    # 1. Validate input image path
-    if not os.path.exists(input_image_path):
-        print(f"Error: Input image file not found at '{input_image_path}'.")
-        return None
+    return _run_sync(agenerate_3d_mesh_from_image(
+        input_image_path, output_dir, do_remove_background,
+        sample_steps, sample_seed, save_intermediates))
 
-    # 2. Create output directory if it doesn't exist
-    try:
-        os.makedirs(output_dir, exist_ok=True)
-    except OSError as e:
-        print(f"Error: Could not create output directory '{output_dir}': {e}")
-        return None
 
-    client = None
-    try:
-        print(f"Connecting to InstantMesh Gradio API at 'TencentARC/InstantMesh'...")
-        # Initialize the Gradio client
-        client = Client("TencentARC/InstantMesh")
-        print("Connection successful.")
+def _image_output_dirs(output_dir: str, input_image_paths: list[str]) -> dict[str, str]:
+    """
+    Assigns each image of a batch its own subdirectory of `output_dir`.
 
-        # 3. Step 1: Preprocess the input image
-        print(
-            f"Calling '/preprocess' with input image '{input_image_path}' (remove_background: {do_remove_background})...")
-        processed_image_gradio_path = client.predict(
-            input_image=file(input_image_path),
-            do_remove_background=do_remove_background,
-            api_name="/preprocess"
-        )
-        print(
-            f"'/preprocess' completed. Result: {processed_image_gradio_path}")
+    The subdirectory is named after the image's filename without extension. When
+    that name is already taken by an earlier image of the batch (e.g. "a/cat.png"
+    and "b/cat.png", or "cat.png" and "cat.jpg"), a short hash of the image's
+    absolute path is appended, so the name stays the same on later runs.
+    """
+    image_output_dirs = {}
+    taken = set()
+    for path in input_image_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if os.path.normcase(name) in taken:
+            path_hash = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+            name = f"{name}-{path_hash}"
+        taken.add(os.path.normcase(name))
+        image_output_dirs[path] = os.path.join(output_dir, name)
+    return image_output_dirs
 
-        # Save the preprocessed image
-        preprocessed_filename = os.path.join(output_dir, "preprocessed_image.png")
-        print(f"Saving preprocessed image to: {preprocessed_filename}")
-        shutil.copy(processed_image_gradio_path, preprocessed_filename)
 
-        # 4. Step 2: Generate multi-views from the processed image
-        # The `gradio_client` handles passing the internal file reference from the previous step.
-        print(
-            f"Calling '/generate_mvs' with processed image (sample_steps: {sample_steps}, sample_seed: {sample_seed})...")
-        generated_mvs_gradio_path = client.predict(
-            # This passes the temporary file path from the server
-            input_image=file(processed_image_gradio_path),
-            sample_steps=sample_steps,
-            sample_seed=sample_seed,
-            api_name="/generate_mvs"
-        )
-        print(
-            f"'/generate_mvs' completed. Result: {generated_mvs_gradio_path}")
-
-        # Save the multi-view generated image
-        multiview_filename = os.path.join(output_dir, "multiview_generation.png")
-        print(f"Saving multi-view generation to: {multiview_filename}")
-        shutil.copy(generated_mvs_gradio_path, multiview_filename)
-
-        # 5. Step 3: Generate 3D model (OBJ and GLB)
-        # This step operates on the internal state after multi-view generation.
-        print("Calling '/make3d' to generate OBJ and GLB models...")
-        obj_model_temp_path, glb_model_temp_path = client.predict(
-            api_name="/make3d"
-        )
-        print(
-            f"'/make3d' completed. Temporary OBJ: {obj_model_temp_path}, Temporary GLB: {glb_model_temp_path}")
+async def agenerate_3d_mesh_batch(
+    input_image_paths: list[str],
+    output_dir: str = "instantmesh_output",
+    do_remove_background: bool = True,
+    sample_steps: float = 75,
+    sample_seed: float = 42,
+    save_intermediates: bool = True,
+    max_workers: int = 4
+) -> dict[str, tuple[str, str] | None]:
+    """Asynchronous version of `generate_3d_mesh_batch`."""
+    # Each image is processed once, as results are keyed by path
+    input_image_paths = list(dict.fromkeys(input_image_paths))
+    image_output_dirs = _image_output_dirs(output_dir, input_image_paths)
 
-        # 6. Save the generated models to the specified output directory
-        obj_filename = os.path.join(
-            output_dir, os.path.basename(obj_model_temp_path))
-        glb_filename = os.path.join(
-            output_dir, os.path.basename(glb_model_temp_path))
+    def needs_preprocess(path: str) -> bool:
+        # Cached images are never sent to the Space, and failures are left for
+        # _generate_3d_mesh to report
+        try:
+            cache_key = _cache_key(path, os.stat(path), do_remove_background,
+                                   sample_steps, sample_seed)
+            return not (_cached_models(image_output_dirs[path], cache_key, save_intermediates)
+                        or _skips_preprocess(path, do_remove_background))
+        except Exception:
+            return False
 
-        print(f"Saving generated OBJ to: {obj_filename}")
-        shutil.copy(obj_model_temp_path, obj_filename)
-        print(f"Saving generated GLB to: {glb_filename}")
-        shutil.copy(glb_model_temp_path, glb_filename)
+    async def submit_preprocess_jobs() -> dict[str, Job]:
+        # '/preprocess' keeps no session state, so the client is returned to the
+        # pool as soon as the jobs are submitted
+        pending = [path for path in input_image_paths
+                   if await asyncio.to_thread(needs_preprocess, path)]
+        jobs = {}
+        if not pending:
+            return jobs
+        try:
+            async with _get_client() as preprocess_client:
+                for path in pending:
+                    try:
+                        jobs[path] = await asyncio.to_thread(
+                            _preprocess, preprocess_client, path,
+                            image_output_dirs[path], do_remove_background)
+                    except Exception as e:
+                        log.debug("Could not submit '/preprocess' for '%s': %s", path, e)
+        except Exception as e:
+            log.error("An error occurred while connecting to the API: %s", e)
+        return jobs
 
-        print(f"\nSuccessfully generated and saved 3D models:")
-        print(f"  Preprocessed image: {preprocessed_filename}")
-        print(f"  Multi-view generation: {multiview_filename}")
-        print(f"  OBJ format: {obj_filename}")
-        print(f"  GLB format: {glb_filename}")
+    # Limits how many images hold a client for '/generate_mvs' and '/make3d' at once
+    workers = asyncio.Semaphore(max_workers)
 
-        return obj_filename, glb_filename
+    async def generate(path: str, preprocess_job: Job | None) -> tuple[str, str] | None:
+        # A failing image must not cancel the rest of the batch
+        try:
+            async with workers:
+                return await _generate_3d_mesh(
+                    http, path, image_output_dirs[path], do_remove_background,
+                    sample_steps, sample_seed, save_intermediates, preprocess_job)
+        except Exception as e:
+            log.error("An error occurred while processing '%s': %s", path, e)
+            return None
 
-    except Exception as e:
-        print(
-            f"\nAn error occurred during API interaction or file operations: {e}")
-        # For more granular error handling, you could catch specific exceptions like
-        # gradio_client.exceptions.AppError for API-specific errors,
-        # requests.exceptions.ConnectionError for network issues, etc.
-        return None
-    finally:
-        # Ensure the client connection is properly closed.
-        if client:
-            client.close()
+    async with httpx.AsyncClient(follow_redirects=True) as http:
+        preprocess_jobs = await submit_preprocess_jobs()
+        results = await asyncio.gather(
+            *(generate(path, preprocess_jobs.get(path)) for path in input_image_paths))
+    return dict(zip(input_image_paths, results))
+
+
+def generate_3d_mesh_batch(
+    input_image_paths: list[str],
+    output_dir: str = "instantmesh_output",
+    do_remove_background: bool = True,
+    sample_steps: float = 75,
+    sample_seed: float = 42,
+    save_intermediates: bool = True,
+    max_workers: int = 4
+) -> dict[str, tuple[str, str] | None]:
+    """
+    Generates 3D meshes for several input images concurrently.
+
+    All images share one event loop. The stateless '/preprocess' step is
+    submitted for every image up front, so its queue waits overlap. At most
+    `max_workers` images then run '/generate_mvs' and '/make3d' at once, each on
+    its own Gradio client since '/make3d' depends on the session state of that
+    client, and the outputs of each image are written to a subdirectory of
+    `output_dir` named after the image's filename without extension, e.g.
+    `<output_dir>/cat/`. If several images share that name, the later ones get
+    a short hash of their path appended, e.g. `<output_dir>/cat-1a2b3c4d/`.
+
+    The work is bound by the remote GPU, so `max_workers` should match the
+    Space's advertised `concurrency_count`; extra workers just wait in the
+    Space's queue. Images whose models are already cached are not sent to the
+    Space at all. An image that fails maps to None without affecting the others.
+
+    Can be called from inside a running event loop (e.g. in Jupyter), in which
+    case the work runs on a worker thread; async code should prefer awaiting
+    `agenerate_3d_mesh_batch` instead.
+
+    Args:
+        input_image_paths (list[str]): Paths to the local input image files.
+        output_dir (str): Directory to save the generated 3D models.
+                          Defaults to "instantmesh_output".
+        do_remove_background (bool): Whether to remove the background during preprocessing.
+                                     Defaults to True.
+        sample_steps (float): Number of sample steps for multi-view generation.
+                              Defaults to 75.
+        sample_seed (float): Seed value for multi-view generation. Defaults to 42.
+        save_intermediates (bool): Whether to download the preprocessed and multi-view
+                                   images alongside the models. Defaults to True.
+        max_workers (int): Maximum number of images processed at once. Defaults to 4.
+
+    Returns:
+        dict[str, tuple[str, str] | None]: Maps each input path to the paths of its
+                                           saved OBJ and GLB files, or None if it failed.
+    """
+    return _run_sync(agenerate_3d_mesh_batch(
+        input_image_paths, output_dir, do_remove_background,
+        sample_steps, sample_seed, save_intermediates, max_workers))
 
 
 # --- Example Usage ---
 if __name__ == "__main__":
     # Set up command-line argument parsing
     parser = argparse.ArgumentParser(
-        description="Generate 3D mesh from an input image using InstantMesh API",
+        description="Generate 3D meshes from input images using InstantMesh API",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
   python api_code.py table_colour.jpg
   python api_code.py table_colour.jpg --output my_outputs
   python api_code.py table_colour.jpg --output my_outputs --steps 100 --seed 456
+  python api_code.py "sketches/*.png" table_colour.jpg --workers 4
         """
     )
 
     parser.add_argument(
         "input_image",
-        help="Path to the input image file"
+        nargs="+",
+        help="Paths or glob patterns of the input image files"
     )
     parser.add_argument(
         "--output", "-o",
@@ -164,39 +880,81 @@ Examples:
         action="store_true",
         help="Keep the background (default: remove background)"
     )
+    parser.add_argument(
+        "--skip-intermediates",
+        action="store_true",
+        help="Only download the OBJ and GLB models, not the preprocessed and multi-view images"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        help="Number of images processed at once when several are given "
+             "(default: number of images, at most 8)"
+    )
 
     args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be a positive integer")
+
+    # Library output is silent by default; set INSTANTMESH_LOG=INFO or DEBUG for progress
+    logging.basicConfig(
+        level=os.environ.get("INSTANTMESH_LOG", "WARNING").upper(),
+        format="%(levelname)s: %(message)s"
+    )
 
-    # Use command-line arguments
-    local_input_image = args.input_image
+    # Use command-line arguments; patterns without matches are kept as given,
+    # so they are reported as missing files. An image matched by several
+    # arguments is only processed once.
+    local_input_images = list(dict.fromkeys(
+        os.path.normpath(path)
+        for pattern in args.input_image
+        for path in (sorted(glob.glob(pattern)) or [pattern])
+    ))
     output_directory_for_meshes = args.output
     sample_steps = args.steps
     sample_seed = args.seed
     remove_background = not args.keep_background
+    save_intermediates = not args.skip_intermediates
+    workers = args.workers or min(8, len(local_input_images))
 
-    if os.path.exists(local_input_image):
-        print(f"Using local image: '{local_input_image}'")
-        print(f"Output directory: '{output_directory_for_meshes}'")
-        print(f"Sample steps: {sample_steps}")
-        print(f"Sample seed: {sample_seed}")
-        print(f"Remove background: {remove_background}")
+    print(f"Using local images: {', '.join(repr(path) for path in local_input_images)}")
+    print(f"Output directory: '{output_directory_for_meshes}'")
+    print(f"Sample steps: {sample_steps}")
+    print(f"Sample seed: {sample_seed}")
+    print(f"Remove background: {remove_background}")
 
+    # Input paths are validated by generate_3d_mesh_from_image itself
+    if len(local_input_images) == 1:
         print(
-            f"\n--- Starting 3D mesh generation for '{local_input_image}' ---")
-        generated_files = generate_3d_mesh_from_image(
-            input_image_path=local_input_image,
+            f"\n--- Starting 3D mesh generation for '{local_input_images[0]}' ---")
+        generated = {local_input_images[0]: generate_3d_mesh_from_image(
+            input_image_path=local_input_images[0],
             output_dir=output_directory_for_meshes,
             do_remove_background=remove_background,
             sample_steps=sample_steps,
-            sample_seed=sample_seed
+            sample_seed=sample_seed,
+            save_intermediates=save_intermediates
+        )}
+    else:
+        print(
+            f"\n--- Starting 3D mesh generation for {len(local_input_images)} images "
+            f"({workers} at a time) ---")
+        generated = generate_3d_mesh_batch(
+            input_image_paths=local_input_images,
+            output_dir=output_directory_for_meshes,
+            do_remove_background=remove_background,
+            sample_steps=sample_steps,
+            sample_seed=sample_seed,
+            save_intermediates=save_intermediates,
+            max_workers=workers
         )
 
+    for local_input_image, generated_files in generated.items():
         if generated_files:
-            print("\nInstantMesh process completed successfully.")
+            print(f"\nInstantMesh process completed successfully for '{local_input_image}'.")
+            print(f"  OBJ format: {generated_files[0]}")
+            print(f"  GLB format: {generated_files[1]}")
         else:
-            print("\nInstantMesh process failed.")
-    else:
-        print(f"\nError: Input image file '{local_input_image}' not found.")
-        print("Please check the file path and try again.")
+            print(f"\nInstantMesh process failed for '{local_input_image}'.")
 
     print("\nScript execution finished.")